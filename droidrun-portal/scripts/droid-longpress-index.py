@@ -5,9 +5,12 @@ import argparse
 import sys
 
 from droidutils import (
-    run_adb,
-    query_tree_with_retry,
-    find_element_by_index,
+    long_press,
+    parse_tree,
+    get_index,
+    query_tree_output,
+    stream_find_element,
+    index_matcher,
     get_tap_point,
     short_class_name,
     ensure_screen_awake,
@@ -26,12 +29,19 @@ def main():
     if args.ensure_awake:
         ensure_screen_awake(serial=args.serial)
 
-    tree = query_tree_with_retry(serial=args.serial, max_retries=1, delay=0, full=args.full)
-    if not tree:
-        print("Error: failed to query a11y tree", file=sys.stderr)
-        sys.exit(1)
-
-    element = find_element_by_index(tree, args.index)
+    if args.full:
+        # --full indices are assigned over the whole tree
+        tree = parse_tree(
+            query_tree_output(serial=args.serial, full=True, check=False, use_cache=True),
+            full=True,
+        )
+        if not tree:
+            print("Error: failed to query a11y tree", file=sys.stderr)
+            sys.exit(1)
+        element = get_index(tree).get(args.index)
+    else:
+        output = query_tree_output(serial=args.serial, use_cache=True)
+        element = stream_find_element(output, index_matcher(args.index))
     if not element:
         print(f"Error: no element found with index {args.index}", file=sys.stderr)
         sys.exit(1)
@@ -45,14 +55,9 @@ def main():
     text = element.get("text", "") or element.get("contentDescription", "")
     class_name = short_class_name(element.get("className", ""))
 
-    # Long-press = swipe with same start/end coordinates
-    run_adb(
-        ["shell", "input", "swipe", str(cx), str(cy), str(cx), str(cy), str(args.duration)],
-        serial=args.serial,
-    )
-
     display_text = f'"{text}"' if text else f"index {args.index}"
-    print(f"Long-pressed {display_text} ({class_name}) at ({cx}, {cy}) for {args.duration}ms")
+    message = f"Long-pressed {display_text} ({class_name}) at ({cx}, {cy}) for {args.duration}ms"
+    long_press(cx, cy, args.duration, serial=args.serial, message=message)
 
 
 if __name__ == "__main__":
@@ -5,9 +5,10 @@ import argparse
 import sys
 
 from droidutils import (
-    run_adb,
-    parse_content_provider,
-    find_element,
+    long_press,
+    query_tree_output,
+    stream_find_element,
+    text_matcher,
     get_tap_point,
     short_class_name,
     ensure_screen_awake,
@@ -19,6 +20,7 @@ def main():
     parser.add_argument("text", nargs="?", help="Text to search for in UI elements")
     parser.add_argument("-s", "--serial", help="Device serial number for adb -s")
     parser.add_argument("--exact", action="store_true", help="Require exact text match")
+    parser.add_argument("--unicode", action="store_true", help="Use Unicode case folding for case-insensitive match")
     parser.add_argument("--duration", type=int, default=1500, help="Long-press duration in ms (default: 1500)")
     parser.add_argument("--coords", nargs=2, type=int, metavar=("X", "Y"), help="Direct coordinates instead of text search")
     parser.add_argument("--ensure-awake", action="store_true", help="Wake screen before action")
@@ -34,14 +36,9 @@ def main():
         cx, cy = args.coords
         display_text = f"coordinates ({cx}, {cy})"
     else:
-        output = run_adb(
-            ["shell", "content", "query", "--uri",
-             "content://com.droidrun.portal/a11y_tree"],
-            serial=args.serial,
-        )
-        tree = parse_content_provider(output)
-
-        element = find_element(tree, args.text, exact=args.exact)
+        output = query_tree_output(serial=args.serial)
+        matcher = text_matcher(args.text, exact=args.exact, casefold=args.unicode)
+        element = stream_find_element(output, matcher)
         if not element:
             print(f"Error: no element found matching \"{args.text}\"", file=sys.stderr)
             sys.exit(1)
@@ -56,13 +53,8 @@ def main():
         class_name = short_class_name(element.get("className", ""))
         display_text = f'"{text}" ({class_name})'
 
-    # Long-press = swipe with same start/end coordinates
-    run_adb(
-        ["shell", "input", "swipe", str(cx), str(cy), str(cx), str(cy), str(args.duration)],
-        serial=args.serial,
-    )
-
-    print(f"Long-pressed {display_text} at ({cx}, {cy}) for {args.duration}ms")
+    message = f"Long-pressed {display_text} at ({cx}, {cy}) for {args.duration}ms"
+    long_press(cx, cy, args.duration, serial=args.serial, message=message)
 
 
 if __name__ == "__main__":
@@ -2,17 +2,21 @@
 """Query Android a11y_tree and output a clean flat list of UI elements."""
 
 import argparse
-import json
 import sys
 
 from droidutils import (
-    query_tree_with_retry,
+    query_tree_and_screen,
+    content_query,
+    parse_tree,
+    parse_content_provider,
+    save_tree_cache,
+    iter_tree,
     walk_tree,
-    format_element,
+    format_elements,
     format_element_json,
-    get_phone_state,
-    get_screen_size,
+    print_json,
     ensure_screen_awake,
+    PHONE_STATE_URI,
 )
 
 
@@ -32,23 +36,25 @@ def main():
     if args.ensure_awake:
         ensure_screen_awake(serial=args.serial)
 
-    # Query tree (uses shared function for consistent index assignment with --full)
-    tree = query_tree_with_retry(serial=args.serial, max_retries=1, delay=0, full=args.full)
+    # Query tree, screen size (for visibility filtering) and phone state
+    # in one round-trip
+    extra = [content_query(PHONE_STATE_URI)] if args.phone_state else []
+    output, (screen_width, screen_height), extra_outputs = query_tree_and_screen(
+        serial=args.serial, full=args.full, extra_commands=extra,
+    )
+
+    # Shared parser gives consistent index assignment with --full
+    tree = parse_tree(output, full=args.full)
     if not tree:
         print("Error: failed to query a11y tree", file=sys.stderr)
         sys.exit(1)
-
-    # Get screen size for visibility filtering
-    screen_width, screen_height = get_screen_size(serial=args.serial)
+    # Lets index scripts reuse the tree these indices came from
+    save_tree_cache(output, serial=args.serial, full=args.full)
 
     elements = []
     if args.all:
         # Flatten everything without filtering
-        def walk_all(nodes):
-            for node in nodes:
-                elements.append(node)
-                walk_all(node.get("children", []))
-        walk_all(tree)
+        elements.extend(iter_tree(tree))
     else:
         # Apply filters
         walk_tree(
@@ -66,7 +72,7 @@ def main():
         # JSON output mode
         json_elements = [format_element_json(el) for el in elements]
         if args.phone_state:
-            state = get_phone_state(serial=args.serial)
+            state = parse_content_provider(extra_outputs[0])
             output_data = {
                 "elements": json_elements,
                 "phoneState": {
@@ -78,17 +84,16 @@ def main():
             }
         else:
             output_data = json_elements
-        print(json.dumps(output_data, indent=2))
+        print_json(output_data)
     else:
         # Human-readable output
         if not elements:
             print("No meaningful UI elements found on screen.")
         else:
-            for el in elements:
-                print(format_element(el))
+            print(format_elements(elements))
 
         if args.phone_state:
-            state = get_phone_state(serial=args.serial)
+            state = parse_content_provider(extra_outputs[0])
             print()
             app = state.get("currentApp", "unknown")
             activity = state.get("activityName", "unknown")
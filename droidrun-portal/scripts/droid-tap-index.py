@@ -5,9 +5,12 @@ import argparse
 import sys
 
 from droidutils import (
-    run_adb,
-    query_tree_with_retry,
-    find_element_by_index,
+    tap,
+    parse_tree,
+    get_index,
+    query_tree_output,
+    stream_find_element,
+    index_matcher,
     get_tap_point,
     short_class_name,
     ensure_screen_awake,
@@ -26,18 +29,27 @@ def main():
     if args.ensure_awake:
         ensure_screen_awake(serial=args.serial)
 
-    tree = query_tree_with_retry(serial=args.serial, max_retries=1, delay=0, full=args.full)
-    if not tree:
-        print("Error: failed to query a11y tree", file=sys.stderr)
-        sys.exit(1)
-
-    element = find_element_by_index(tree, args.index)
+    if args.full or args.avoid_overlap:
+        # --full indices are assigned over the whole tree, and overlap
+        # detection needs it too
+        tree = parse_tree(
+            query_tree_output(serial=args.serial, full=args.full, check=False, use_cache=True),
+            full=args.full,
+        )
+        if not tree:
+            print("Error: failed to query a11y tree", file=sys.stderr)
+            sys.exit(1)
+        element = get_index(tree).get(args.index)
+    else:
+        tree = None
+        output = query_tree_output(serial=args.serial, use_cache=True)
+        element = stream_find_element(output, index_matcher(args.index))
     if not element:
         print(f"Error: no element found with index {args.index}", file=sys.stderr)
         sys.exit(1)
 
     # Get tap point (with overlap avoidance if requested)
-    tap_point = get_tap_point(element, tree if args.avoid_overlap else None)
+    tap_point = get_tap_point(element, tree)
     if not tap_point:
         print(f"Error: element has no bounds: {element}", file=sys.stderr)
         sys.exit(1)
@@ -46,10 +58,8 @@ def main():
     text = element.get("text", "") or element.get("contentDescription", "")
     class_name = short_class_name(element.get("className", ""))
 
-    run_adb(["shell", "input", "tap", str(cx), str(cy)], serial=args.serial)
-
     display_text = f'"{text}"' if text else f"index {args.index}"
-    print(f"Tapped {display_text} ({class_name}) at ({cx}, {cy})")
+    tap(cx, cy, serial=args.serial, message=f"Tapped {display_text} ({class_name}) at ({cx}, {cy})")
 
 
 if __name__ == "__main__":
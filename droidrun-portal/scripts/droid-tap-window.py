@@ -6,44 +6,44 @@ overlays are not visible in the accessibility tree.
 """
 
 import argparse
-import re
 import sys
 
-from droidutils import run_adb, ensure_screen_awake
+from droidutils import (
+    run_adb,
+    tap,
+    long_press,
+    ensure_screen_awake,
+    WINDOW_PATTERN,
+)
 
-
-def parse_region(region_str):
-    """Parse SkRegion string into bounds tuple."""
-    match = re.search(r'\((-?\d+),(-?\d+),(-?\d+),(-?\d+)\)', region_str)
-    if match:
-        return tuple(int(x) for x in match.groups())
-    return None
+# How far before the first name occurrence a window entry may start
+PREFILTER_RADIUS = 2048
 
 
 def find_window(dumpsys_output, name_filter):
     """Find a window by name and return its touchable region center."""
-    # Parse each window entry directly in the output
-    # Format: ", hash name, frame=[Rect(x1, y1 - x2, y2)], touchableRegion=SkRegion((...)), ..."
-    window_pattern = re.compile(
-        r'(?:[\[,]\s*)([a-f0-9]+)\s+([^,]+),\s*'
-        r'frame=\[Rect\((\d+),\s*(\d+)\s*-\s*(\d+),\s*(\d+)\)\],\s*'
-        r'touchableRegion=(SkRegion\(\([^)]+\)\))'
-    )
-
-    for match in window_pattern.finditer(dumpsys_output):
+    name_lower = name_filter.lower()
+    haystack = dumpsys_output.lower()
+
+    # Cheap prefilter: skip the regex entirely when the name never occurs,
+    # and start scanning just before its first occurrence otherwise
+    first = haystack.find(name_lower)
+    if first == -1:
+        return None
+    # (offsets only carry over if lowercasing didn't change the length)
+    start = max(first - PREFILTER_RADIUS, 0) if len(haystack) == len(dumpsys_output) else 0
+
+    for match in WINDOW_PATTERN.finditer(dumpsys_output, start):
         window_name = match.group(2).strip()
 
-        if name_filter.lower() in window_name.lower():
-            region_str = match.group(7)
-            region = parse_region(region_str)
-
-            if region:
-                center = ((region[0] + region[2]) // 2, (region[1] + region[3]) // 2)
-                return {
-                    'name': window_name,
-                    'region': region,
-                    'center': center,
-                }
+        if name_lower in window_name.lower():
+            region = tuple(map(int, match.groups()[6:10]))
+            center = ((region[0] + region[2]) // 2, (region[1] + region[3]) // 2)
+            return {
+                'name': window_name,
+                'region': region,
+                'center': center,
+            }
 
     return None
 
@@ -78,14 +78,10 @@ def main():
     cx, cy = window['center']
 
     if args.long_press:
-        run_adb(
-            ["shell", "input", "swipe", str(cx), str(cy), str(cx), str(cy), str(args.duration)],
-            serial=args.serial,
-        )
-        print(f"Long-pressed \"{window['name']}\" at ({cx}, {cy}) for {args.duration}ms")
+        message = f"Long-pressed \"{window['name']}\" at ({cx}, {cy}) for {args.duration}ms"
+        long_press(cx, cy, args.duration, serial=args.serial, message=message)
     else:
-        run_adb(["shell", "input", "tap", str(cx), str(cy)], serial=args.serial)
-        print(f"Tapped \"{window['name']}\" at ({cx}, {cy})")
+        tap(cx, cy, serial=args.serial, message=f"Tapped \"{window['name']}\" at ({cx}, {cy})")
 
 
 if __name__ == "__main__":
@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
-"""Find a UI element by text and tap it."""
+"""Find a UI element by text and tap it (or tap direct coordinates)."""
 
 import argparse
 import sys
 
 from droidutils import (
-    run_adb,
+    tap,
+    query_tree_output,
     parse_content_provider,
+    stream_find_element,
+    text_matcher,
     find_element,
     get_tap_point,
     short_class_name,
@@ -16,41 +19,52 @@ from droidutils import (
 
 def main():
     parser = argparse.ArgumentParser(description="Find UI element by text and tap it")
-    parser.add_argument("text", help="Text to search for in UI elements")
+    parser.add_argument("text", nargs="?", help="Text to search for in UI elements")
     parser.add_argument("-s", "--serial", help="Device serial number for adb -s")
     parser.add_argument("--exact", action="store_true", help="Require exact text match")
+    parser.add_argument("--unicode", action="store_true", help="Use Unicode case folding for case-insensitive match")
     parser.add_argument("--avoid-overlap", action="store_true", help="Find clear tap point avoiding overlaps")
+    parser.add_argument("--coords", nargs=2, type=int, metavar=("X", "Y"), help="Direct coordinates instead of text search")
     parser.add_argument("--ensure-awake", action="store_true", help="Wake screen before action")
     args = parser.parse_args()
 
+    if not args.text and not args.coords:
+        parser.error("Either text or --coords is required")
+
     if args.ensure_awake:
         ensure_screen_awake(serial=args.serial)
 
-    output = run_adb(
-        ["shell", "content", "query", "--uri",
-         "content://com.droidrun.portal/a11y_tree"],
-        serial=args.serial,
-    )
-    tree = parse_content_provider(output)
-
-    element = find_element(tree, args.text, exact=args.exact)
-    if not element:
-        match_type = "exactly matching" if args.exact else "containing"
-        print(f"Error: no element found with text {match_type} \"{args.text}\"", file=sys.stderr)
-        sys.exit(1)
-
-    # Get tap point (with overlap avoidance if requested)
-    tap_point = get_tap_point(element, tree if args.avoid_overlap else None)
-    if not tap_point:
-        print(f"Error: element has no bounds: {element}", file=sys.stderr)
-        sys.exit(1)
-
-    cx, cy = tap_point
-    text = element.get("text", "")
-    class_name = short_class_name(element.get("className", ""))
-
-    run_adb(["shell", "input", "tap", str(cx), str(cy)], serial=args.serial)
-    print(f"Tapped \"{text}\" ({class_name}) at ({cx}, {cy})")
+    if args.coords:
+        # Known coordinates: no tree query needed
+        cx, cy = args.coords
+        display_text = f"coordinates ({cx}, {cy})"
+    else:
+        output = query_tree_output(serial=args.serial)
+        if args.avoid_overlap:
+            # Overlap detection needs the whole tree
+            tree = parse_content_provider(output)
+            element = find_element(tree, args.text, exact=args.exact, casefold=args.unicode)
+        else:
+            tree = None
+            matcher = text_matcher(args.text, exact=args.exact, casefold=args.unicode)
+            element = stream_find_element(output, matcher)
+        if not element:
+            match_type = "exactly matching" if args.exact else "containing"
+            print(f"Error: no element found with text {match_type} \"{args.text}\"", file=sys.stderr)
+            sys.exit(1)
+
+        # Get tap point (with overlap avoidance if requested)
+        tap_point = get_tap_point(element, tree)
+        if not tap_point:
+            print(f"Error: element has no bounds: {element}", file=sys.stderr)
+            sys.exit(1)
+
+        cx, cy = tap_point
+        text = element.get("text", "")
+        class_name = short_class_name(element.get("className", ""))
+        display_text = f'"{text}" ({class_name})'
+
+    tap(cx, cy, serial=args.serial, message=f"Tapped {display_text} at ({cx}, {cy})")
 
 
 if __name__ == "__main__":
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-"""Poll a11y_tree until an element matching text appears."""
+"""Poll a11y_tree until an element matching text (or resource ID) appears."""
 
 import argparse
 import sys
@@ -8,49 +8,67 @@ import time
 from droidutils import (
     query_tree_with_retry,
     find_element,
+    node_bounds,
     center_of,
-    parse_bounds,
     short_class_name,
     ensure_screen_awake,
 )
 
+# Poll quickly at first, backing off to at most POLL_MAX_DELAY between polls
+POLL_INITIAL_DELAY = 0.1
+POLL_MAX_DELAY = 1.0
+POLL_BACKOFF = 1.6
+
 
 def main():
     parser = argparse.ArgumentParser(description="Wait for UI element to appear")
-    parser.add_argument("text", help="Text to search for in UI elements")
+    parser.add_argument("text", nargs="?", help="Text to search for in UI elements")
     parser.add_argument("-s", "--serial", help="Device serial number for adb -s")
     parser.add_argument("--timeout", type=int, default=10, help="Timeout in seconds (default: 10)")
     parser.add_argument("--exact", action="store_true", help="Require exact text match")
+    parser.add_argument("--unicode", action="store_true", help="Use Unicode case folding for case-insensitive match")
+    parser.add_argument("--resource-id", help="Only match within elements with this resource ID (full or short form)")
     parser.add_argument("--ensure-awake", action="store_true", help="Wake screen before waiting")
     args = parser.parse_args()
 
+    if not args.text and not args.resource_id:
+        parser.error("Either text or --resource-id is required")
+    target = f'"{args.text}"' if args.text else f"id={args.resource_id}"
+
     if args.ensure_awake:
         ensure_screen_awake(serial=args.serial)
 
-    start = time.time()
+    # Every poll goes through the device's persistent adb shell session
+    # (see droidutils.get_shell()), so only the first one pays for adb startup
+    start = time.monotonic()
+    deadline = start + args.timeout
+    delay = POLL_INITIAL_DELAY
     while True:
-        elapsed = time.time() - start
-        if elapsed >= args.timeout:
-            print(f"Timeout: \"{args.text}\" not found after {args.timeout}s", file=sys.stderr)
-            sys.exit(1)
-
+        elapsed = time.monotonic() - start
         tree = query_tree_with_retry(serial=args.serial, max_retries=1, delay=0)
         if tree:
-            element = find_element(tree, args.text, exact=args.exact)
+            element = find_element(tree, args.text, exact=args.exact, casefold=args.unicode,
+                                   resource_id=args.resource_id)
             if element:
                 text = element.get("text", "")
-                bounds = element.get("bounds", "")
+                bounds = node_bounds(element)
                 class_name = short_class_name(element.get("className", ""))
                 parts = [f"Found \"{text}\" ({class_name})"]
                 if bounds:
+                    l, t, r, b = bounds
                     cx, cy = center_of(bounds)
-                    l, t, r, b = parse_bounds(bounds)
                     parts.append(f"at center=({cx},{cy}) bounds=({l},{t},{r},{b})")
                 parts.append(f"after {elapsed:.1f}s")
                 print(" ".join(parts))
                 return
 
-        time.sleep(1)
+        # The last sleep is cut short so the final poll lands on the deadline
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            print(f"Timeout: {target} not found after {args.timeout}s", file=sys.stderr)
+            sys.exit(1)
+        time.sleep(min(delay, remaining))
+        delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
 
 
 if __name__ == "__main__":
@@ -7,23 +7,33 @@ in the accessibility tree.
 
 import argparse
 import re
-import json
 import sys
 
-from droidutils import run_adb
-
-
-def parse_region(region_str):
-    """Parse SkRegion string into bounds tuple.
-
-    Examples:
-        "SkRegion((-39,1439,183,1661))" -> (-39, 1439, 183, 1661)
-        "SkRegion((0,0,1080,2400))" -> (0, 0, 1080, 2400)
-    """
-    match = re.search(r'\((-?\d+),(-?\d+),(-?\d+),(-?\d+)\)', region_str)
-    if match:
-        return tuple(int(x) for x in match.groups())
-    return None
+from droidutils import run_adb, print_json, WINDOW_PATTERN
+
+# Known overlay patterns (matched case-insensitively)
+OVERLAY_PATTERNS = [
+    'Bubbles',
+    'PictureInPicture',
+    'pip',
+    'SystemUI',
+    'Floating',
+    'Overlay',
+]
+
+# Exclude patterns (system chrome, not user-interactive overlays)
+EXCLUDE_PATTERNS = [
+    'StatusBar',
+    'NavigationBar',
+    'ScreenDecor',
+    'InputMethod',
+    'NotificationShade',
+    'com.droidrun.portal',  # Our own overlay
+]
+
+# One alternation per list, so each window is tested with a single search
+_OVERLAY_RE = re.compile("|".join(map(re.escape, OVERLAY_PATTERNS)), re.IGNORECASE)
+_EXCLUDE_RE = re.compile("|".join(map(re.escape, EXCLUDE_PATTERNS)))
 
 
 def parse_windows(dumpsys_output):
@@ -32,15 +42,8 @@ def parse_windows(dumpsys_output):
     seen_hashes = set()
 
     # Find each window entry directly in the output
-    # Format: ", hash name, frame=[Rect(x1, y1 - x2, y2)], touchableRegion=SkRegion((...)), ..."
-    # Window entries start after [ or , in the visible windows list
-    window_pattern = re.compile(
-        r'(?:[\[,]\s*)([a-f0-9]+)\s+([^,]+),\s*'
-        r'frame=\[Rect\((\d+),\s*(\d+)\s*-\s*(\d+),\s*(\d+)\)\],\s*'
-        r'touchableRegion=(SkRegion\(\([^)]+\)\))'
-    )
-
-    for match in window_pattern.finditer(dumpsys_output):
+    # (the touchable region is captured by the same pattern, no second pass)
+    for match in WINDOW_PATTERN.finditer(dumpsys_output):
         window_hash = match.group(1)
 
         # Skip duplicates (windows appear in multiple sections)
@@ -48,23 +51,16 @@ def parse_windows(dumpsys_output):
             continue
         seen_hashes.add(window_hash)
 
-        window_name = match.group(2).strip()
-        frame = (int(match.group(3)), int(match.group(4)),
-                 int(match.group(5)), int(match.group(6)))
-        region_str = match.group(7)
-        region = parse_region(region_str)
-
-        if region:
-            # Calculate center of touchable region
-            center = ((region[0] + region[2]) // 2, (region[1] + region[3]) // 2)
+        fl, ft, fr, fb, rl, rt, rr, rb = map(int, match.groups()[2:])
 
-            windows.append({
-                'name': window_name,
-                'hash': window_hash,
-                'frame': frame,
-                'touchable_region': region,
-                'center': center,
-            })
+        windows.append({
+            'name': match.group(2).strip(),
+            'hash': window_hash,
+            'frame': (fl, ft, fr, fb),
+            'touchable_region': (rl, rt, rr, rb),
+            # Center of touchable region
+            'center': ((rl + rr) // 2, (rt + rb) // 2),
+        })
 
     return windows
 
@@ -73,35 +69,15 @@ def find_overlay_windows(windows):
     """Filter for likely overlay windows (bubbles, PiP, etc.)."""
     overlays = []
 
-    # Known overlay patterns
-    overlay_patterns = [
-        'Bubbles',
-        'PictureInPicture',
-        'pip',
-        'SystemUI',
-        'Floating',
-        'Overlay',
-    ]
-
-    # Exclude patterns (system chrome, not user-interactive overlays)
-    exclude_patterns = [
-        'StatusBar',
-        'NavigationBar',
-        'ScreenDecor',
-        'InputMethod',
-        'NotificationShade',
-        'com.droidrun.portal',  # Our own overlay
-    ]
-
     for window in windows:
         name = window['name']
 
         # Skip excluded windows
-        if any(excl in name for excl in exclude_patterns):
+        if _EXCLUDE_RE.search(name):
             continue
 
         # Check if it's a known overlay type
-        is_overlay = any(pattern.lower() in name.lower() for pattern in overlay_patterns)
+        is_overlay = _OVERLAY_RE.search(name) is not None
 
         # Also consider windows with small touchable regions as potential overlays
         region = window['touchable_region']
@@ -143,7 +119,7 @@ def main():
         windows = find_overlay_windows(windows)
 
     if args.json:
-        print(json.dumps(windows, indent=2))
+        print_json(windows)
     else:
         if not windows:
             print("No overlay windows found. Use --all to see all windows.")
@@ -7,13 +7,24 @@ Improvements from droidrun library:
 - Keyboard element filtering
 - Retry logic with configurable attempts
 - Clear point detection for overlapping elements
+- Persistent adb shell session shared by all shell commands
+- orjson-accelerated JSON handling when installed (stdlib json otherwise)
 """
 
+import atexit
+import functools
 import json
+import os
+import re
+import selectors
 import subprocess
 import sys
 import time
-from typing import Optional
+
+try:
+    import orjson  # Optional: faster JSON parsing/serialization for large trees
+except ImportError:
+    orjson = None
 
 # =============================================================================
 # Constants
@@ -23,6 +34,44 @@ MIN_ELEMENT_SIZE = 5  # Minimum element size in pixels
 VISIBILITY_THRESHOLD = 0.1  # 10% of element must be visible
 MAX_RETRIES = 3
 RETRY_DELAY = 0.5
+WAKE_TIMEOUT = 0.3  # Max seconds to wait for the screen to turn on
+WAKE_POLL_INTERVAL = 0.02
+
+# ContentProvider URIs
+A11Y_TREE_URI = "content://com.droidrun.portal/a11y_tree"
+A11Y_TREE_FULL_URI = "content://com.droidrun.portal/a11y_tree_full"
+PHONE_STATE_URI = "content://com.droidrun.portal/phone_state"
+
+# Shell commands
+SCREEN_SIZE_CMD = "wm size"
+BATCH_SEPARATOR = "__SEP__"  # Echoed between commands in batch_query()
+
+# Seconds a queried a11y tree may be reused by later invocations (0 = disabled)
+TREE_CACHE_TTL = float(os.environ.get("DROID_TREE_CACHE_TTL", "0"))
+
+DEFAULT_SCREEN_SIZE = (1080, 1920)
+SCREEN_SIZE_CACHE_TTL = 300  # Seconds a queried screen size is reused across invocations
+
+# Inject taps with sendevent instead of `input` (avoids a JVM start per tap)
+FAST_TAP = os.environ.get("DROID_FAST_TAP") == "1"
+TOUCH_DEVICE_CACHE_TTL = 3600  # Seconds the touchscreen device info is reused
+
+# Set DROID_NO_EXEC=1 to keep the final adb call as a child process
+NO_EXEC = os.environ.get("DROID_NO_EXEC") == "1"
+
+# Linux input event codes used by sendevent
+EV_SYN, EV_KEY, EV_ABS = 0, 1, 3
+SYN_REPORT = 0
+BTN_TOUCH = 330
+ABS_MT_POSITION_X, ABS_MT_POSITION_Y, ABS_MT_TRACKING_ID = 53, 54, 57
+SENDEVENT_FAILED = "__SENDEVENT_FAILED__"  # Echoed by sendevent_touch() on error
+
+_WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+_SIZE_RE = re.compile(r"size:\s*(\d+)\s*x\s*(\d+)", re.IGNORECASE)
+_SIZE_BYTES_RE = re.compile(_SIZE_RE.pattern.encode(), re.IGNORECASE)
+_OVERRIDE_SIZE_RE = re.compile(r"Override size:\s*(\d+)\s*x\s*(\d+)", re.IGNORECASE)
+_TOUCH_AXIS_RE = re.compile(r"ABS_MT_POSITION_([XY])\s*:.*\bmax (\d+)")
+_INPUT_DEVICE_RE = re.compile(r"/dev/input/event\d+")
 
 # Node classes that are just layout containers (no meaningful content)
 NOISE_CLASSES = {
@@ -33,6 +82,31 @@ NOISE_CLASSES = {
     "ComposeView", "AndroidComposeView",
 }
 
+# Packages the noise classes usually come from
+NOISE_PACKAGES = (
+    "android.widget.", "android.view.",
+    "androidx.constraintlayout.widget.", "androidx.coordinatorlayout.widget.",
+    "androidx.core.widget.", "androidx.recyclerview.widget.",
+    "androidx.viewpager.widget.", "androidx.viewpager2.widget.",
+    "androidx.compose.ui.platform.",
+)
+
+# Fully-qualified and short noise class names -> short name, precomputed so
+# is_noise() can skip splitting the class name for common classes
+NOISE_CLASS_NAMES = {
+    **{short: short for short in NOISE_CLASSES},
+    **{prefix + short: short for prefix in NOISE_PACKAGES for short in NOISE_CLASSES},
+}
+
+# Window entry in `dumpsys window windows` output; entries start after [ or ,
+# Format: ", hash name, frame=[Rect(x1, y1 - x2, y2)], touchableRegion=SkRegion((...)), ..."
+# Groups: hash, name, frame (l, t, r, b), touchable region (l, t, r, b)
+WINDOW_PATTERN = re.compile(
+    r'(?:[\[,]\s*)([a-f0-9]+)\s+([^,]+),\s*'
+    r'frame=\[Rect\((\d+),\s*(\d+)\s*-\s*(\d+),\s*(\d+)\)\],\s*'
+    r'touchableRegion=SkRegion\(\((-?\d+),(-?\d+),(-?\d+),(-?\d+)\)\)'
+)
+
 # Keyboard element prefixes to filter out
 KEYBOARD_PREFIXES = [
     "com.google.android.inputmethod",
@@ -41,58 +115,343 @@ KEYBOARD_PREFIXES = [
 ]
 
 
+# =============================================================================
+# JSON Utilities
+# =============================================================================
+
+def json_loads(data):
+    """Parse JSON from str or bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj):
+    """Serialize obj as indented JSON text, using orjson when available.
+
+    Non-ASCII text is kept as is, as orjson does, so the output doesn't
+    depend on whether orjson is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode("utf-8")
+    return json.dumps(obj, indent=2, ensure_ascii=False)
+
+
+def print_json(obj):
+    """Print obj as indented JSON, encoded as UTF-8.
+
+    The encoded bytes go straight to the stdout buffer. With orjson they
+    are not decoded to str and re-encoded by print(), and either way the
+    output doesn't depend on the locale's stdout encoding.
+    """
+    out = getattr(sys.stdout, "buffer", None)
+    if out is None:
+        print(json_dumps(obj))
+        return
+    if orjson is not None:
+        data = orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    else:
+        data = json_dumps(obj).encode("utf-8")
+    sys.stdout.flush()
+    out.write(data)
+    out.write(b"\n")
+    out.flush()
+
+
 # =============================================================================
 # ADB Utilities
 # =============================================================================
 
+class ShellUnavailableError(OSError):
+    """The persistent shell can't take a command, which was not sent."""
+
+
+class PersistentAdbShell:
+    """Long-lived `adb shell` session that runs commands without respawning adb.
+
+    Each command is followed by a sentinel echo carrying its exit code, so
+    replies can be framed on a single stdout stream. Stderr is framed the
+    same way so error messages stay available to callers. That needs
+    adb's shell protocol (shell_v2), which keeps the two streams apart;
+    without it the session is not used.
+    """
+
+    def __init__(self, serial=None):
+        self.serial = serial
+        self.proc = None
+        self.unsupported = False
+        self._token = f"__END_{os.urandom(4).hex()}__".encode()
+
+    def _start(self, timeout):
+        """Start the session and check that it keeps stderr separate.
+
+        Raises:
+            ShellUnavailableError: If adb could not be started, exited, or
+                merges stderr into stdout (no shell_v2 on the device)
+        """
+        try:
+            self.proc = subprocess.Popen(
+                [*adb_prefix(self.serial), "shell"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                bufsize=0,
+            )
+            token = self._token.decode()
+            self.proc.stdin.write(f'echo "{token}" >&2; echo "{token}0"\n'.encode())
+            # Merged streams (or a pty echoing the probe) put the token
+            # twice on stdout
+            stdout, stderr = self._read_until(
+                timeout,
+                lambda out, err: out.endswith(b"\n") and (
+                    self._token in err or out.count(self._token) > 1),
+            )
+        except (OSError, ValueError, subprocess.TimeoutExpired) as e:
+            self.close()
+            raise ShellUnavailableError("adb shell session could not be started") from e
+        if self._token not in stderr:
+            self.close()
+            self.unsupported = True
+            raise ShellUnavailableError("adb shell merges stderr into stdout")
+
+    def run(self, command, timeout=10):
+        """Run a shell command in the session.
+
+        Args:
+            command: Shell command line to execute on the device
+            timeout: Seconds to wait for the command to finish
+
+        Returns:
+            Tuple (returncode, stdout bytes, stderr str)
+
+        Raises:
+            ShellUnavailableError: If the session could not be started or
+                the command could not be sent; the command did not run
+            OSError: If the session died after the command was sent
+            subprocess.TimeoutExpired: If the command did not finish in time
+        """
+        if self.unsupported:
+            raise ShellUnavailableError("adb shell merges stderr into stdout")
+        if self.proc is None or self.proc.poll() is not None:
+            self._start(timeout)
+        token = self._token.decode()
+        line = f'{command}; echo "{token}$?"; echo "{token}" >&2\n'
+        try:
+            self.proc.stdin.write(line.encode())
+        except (BrokenPipeError, ValueError) as e:
+            self.close()
+            raise ShellUnavailableError("adb shell session closed") from e
+
+        # stdout sentinel carries the exit code, so wait for its newline
+        stdout, stderr = self._read_until(
+            timeout,
+            lambda out, err: self._token in out and out.endswith(b"\n") and self._token in err,
+        )
+        end = stdout.rindex(self._token)
+        code = stdout[end + len(self._token):].strip()
+        returncode = int(code) if code.isdigit() else 1
+        # Truncate in place so the (possibly large) reply is copied only once
+        del stdout[end:]
+        stderr = stderr[:stderr.rindex(self._token)].decode("utf-8", errors="replace")
+        return returncode, bytes(stdout), stderr
+
+    def _read_until(self, timeout, finished):
+        """Read stdout and stderr (as bytearrays) until finished(stdout, stderr)."""
+        stdout, stderr = bytearray(), bytearray()
+        buffers = {self.proc.stdout: stdout, self.proc.stderr: stderr}
+        deadline = time.monotonic() + timeout
+        with selectors.DefaultSelector() as sel:
+            for stream in buffers:
+                sel.register(stream, selectors.EVENT_READ)
+            while not finished(stdout, stderr):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.close()
+                    raise subprocess.TimeoutExpired("adb shell", timeout)
+                for key, _ in sel.select(remaining):
+                    chunk = os.read(key.fd, 65536)
+                    if not chunk:
+                        self.close()
+                        raise OSError("adb shell session closed")
+                    buffers[key.fileobj] += chunk
+        return stdout, stderr
+
+    @property
+    def running(self):
+        """Whether the session has been started and is still alive."""
+        return self.proc is not None and self.proc.poll() is None
+
+    def close(self):
+        """Terminate the session."""
+        if self.proc is None:
+            return
+        proc, self.proc = self.proc, None
+        try:
+            proc.stdin.close()
+            proc.wait(timeout=1)
+        except (OSError, subprocess.TimeoutExpired):
+            proc.kill()
+            proc.wait()
+
+
+_shells = {}
+_adb_prefixes = {}
+
+
+def adb_prefix(serial=None):
+    """Get the `adb [-s serial]` argv prefix, built once per serial."""
+    prefix = _adb_prefixes.get(serial)
+    if prefix is None:
+        prefix = _adb_prefixes[serial] = ("adb", "-s", serial) if serial else ("adb",)
+    return prefix
+
+
+def get_shell(serial=None):
+    """Get the shared persistent shell session for a device."""
+    shell = _shells.get(serial)
+    if shell is None:
+        shell = _shells[serial] = PersistentAdbShell(serial)
+        atexit.register(shell.close)
+    return shell
+
+
+def is_screen_awake(serial=None):
+    """Check whether the device is awake (screen on).
+
+    Args:
+        serial: Device serial number for adb -s
+
+    Returns:
+        True if awake, False if asleep or dozing, None if the state is unknown
+    """
+    output = run_adb(["shell", "dumpsys", "power", "|", "grep", "mWakefulness="],
+                     serial=serial, check=False)
+    if not output:
+        return None
+    return "Awake" in output
+
+
 def ensure_screen_awake(serial=None):
     """Wake screen if it's off.
 
+    Returns right away if the screen is already on. Otherwise sends
+    KEYCODE_WAKEUP and polls until the device reports being awake, for
+    at most WAKE_TIMEOUT seconds.
+
     Args:
         serial: Device serial number for adb -s
     """
+    if is_screen_awake(serial):
+        return
     run_adb(["shell", "input", "keyevent", "KEYCODE_WAKEUP"], serial=serial, check=False)
-    time.sleep(0.3)
+    # Orientation may differ once the screen is back on
+    invalidate_screen_size_cache(serial)
+
+    # If the state can't be read, this waits out the full timeout as before
+    deadline = time.monotonic() + WAKE_TIMEOUT
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(WAKE_POLL_INTERVAL, remaining))
+        if is_screen_awake(serial):
+            return
 
 
-def run_adb(args, serial=None, timeout=10, check=True):
+def run_adb(args, serial=None, timeout=10, check=True, binary=False):
     """Run an adb command and return stdout.
 
+    Shell commands are routed through the persistent session for the
+    device so repeated calls skip the adb process/handshake overhead.
+
     Args:
         args: List of arguments to pass to adb
         serial: Device serial number for adb -s
         timeout: Command timeout in seconds
         check: If True, exit on error; if False, return None on error
+        binary: If True, return stdout as undecoded bytes (e.g. for large
+                JSON payloads that are parsed straight from bytes)
 
     Returns:
         Command stdout, or None if check=False and command failed
     """
-    cmd = ["adb"]
-    if serial:
-        cmd += ["-s", serial]
-    cmd += args
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        if len(args) > 1 and args[0] == "shell" and os.name != "nt":
+            try:
+                returncode, stdout, stderr = get_shell(serial).run(" ".join(args[1:]), timeout=timeout)
+            except ShellUnavailableError:
+                # The command was not sent; the one-shot path runs it and
+                # reports the underlying adb error properly
+                returncode, stdout, stderr = _run_adb_once(args, serial, timeout)
+        else:
+            returncode, stdout, stderr = _run_adb_once(args, serial, timeout)
     except FileNotFoundError:
         if check:
             print("Error: adb not found. Is Android SDK installed and on PATH?", file=sys.stderr)
             sys.exit(1)
         return None
+    except OSError as e:
+        # Session died after the command was sent; not retried, as it
+        # may already have run
+        if check:
+            print(f"Error: adb failed: {e}", file=sys.stderr)
+            sys.exit(1)
+        return None
     except subprocess.TimeoutExpired:
         if check:
             print("Error: adb command timed out", file=sys.stderr)
             sys.exit(1)
         return None
-    if result.returncode != 0:
+    if returncode != 0:
         if check:
-            stderr = result.stderr.strip()
+            stderr = stderr.strip()
             if "no devices" in stderr or "not found" in stderr:
                 print("Error: no Android device connected", file=sys.stderr)
             else:
                 print(f"Error: adb failed: {stderr}", file=sys.stderr)
             sys.exit(1)
         return None
-    return result.stdout
+    return stdout if binary else stdout.decode("utf-8", errors="replace")
+
+
+def run_adb_exec(args, serial=None, message=None):
+    """Run a script's final adb shell command, replacing the current process.
+
+    adb's exit status becomes the script's. Saves a fork+wait when nothing
+    else follows the command. The message is echoed by the device after
+    the command succeeds, so a failed command never reports success.
+    adb runs without run_adb()'s timeout here. Falls back to run_adb()
+    when a persistent shell is already open (reusing it is cheaper than a
+    fresh adb), for non-shell commands, on Windows, or when DROID_NO_EXEC=1.
+
+    Args:
+        args: List of arguments to pass to adb
+        serial: Device serial number for adb -s
+        message: Success message for stdout
+    """
+    shell = _shells.get(serial)
+    if (NO_EXEC or os.name == "nt" or args[0] != "shell"
+            or (shell is not None and shell.running)):
+        run_adb(args, serial=serial)
+        if message:
+            print(message)
+        return
+    if message:
+        # Imported lazily: only this path needs it
+        import shlex
+        args = ["shell", f"{' '.join(args[1:])} && echo {shlex.quote(message)}"]
+    sys.stdout.flush()
+    try:
+        os.execvp("adb", [*adb_prefix(serial), *args])
+    except FileNotFoundError:
+        print("Error: adb not found. Is Android SDK installed and on PATH?", file=sys.stderr)
+        sys.exit(1)
+
+
+def _run_adb_once(args, serial, timeout):
+    """Spawn a one-shot adb process and return (returncode, stdout bytes, stderr str)."""
+    result = subprocess.run([*adb_prefix(serial), *args], capture_output=True, timeout=timeout)
+    return result.returncode, result.stdout, result.stderr.decode("utf-8", errors="replace")
 
 
 def parse_content_provider(output, check=True):
@@ -105,29 +464,55 @@ def parse_content_provider(output, check=True):
     Returns:
         Parsed JSON result, or None if check=False and parsing failed
     """
+    result = content_provider_result(output, check=check)
+    if result is None:
+        return None
+    try:
+        return json_loads(result)
+    except json.JSONDecodeError as e:
+        if check:
+            print(f"Error: JSON parse failed: {e}", file=sys.stderr)
+            sys.exit(1)
+        return None
+
+
+def content_provider_result(output, check=True):
+    """Extract the still-encoded JSON result from a ContentProvider response.
+
+    Args:
+        output: Raw adb output (str or bytes)
+        check: If True, exit on error; if False, return None on error
+
+    Returns:
+        Result JSON string, or None if check=False and parsing failed
+    """
     if not output:
         if check:
             print("Error: empty response from ContentProvider", file=sys.stderr)
             sys.exit(1)
         return None
 
-    line = output.strip()
-    prefix = "Row: 0 result="
+    # No full strip(): it would copy the whole payload, and the JSON parser
+    # skips the trailing newline anyway
+    line = output.lstrip() if output[:1].isspace() else output
+    prefix = b"Row: 0 result=" if isinstance(line, bytes) else "Row: 0 result="
     if not line.startswith(prefix):
         if check:
-            print(f"Error: unexpected response format: {line[:80]}", file=sys.stderr)
+            head = line[:80].decode("utf-8", errors="replace") if isinstance(line, bytes) else line[:80]
+            print(f"Error: unexpected response format: {head}", file=sys.stderr)
             sys.exit(1)
         return None
 
+    # The outer JSON is parsed straight from bytes; only the result is decoded
     json_str = line[len(prefix):]
     try:
-        outer = json.loads(json_str)
+        outer = json_loads(json_str)
         if outer.get("status") != "success":
             if check:
                 print(f"Error: query failed: {outer}", file=sys.stderr)
                 sys.exit(1)
             return None
-        return json.loads(outer["result"])
+        return outer["result"]
     except (json.JSONDecodeError, KeyError) as e:
         if check:
             print(f"Error: JSON parse failed: {e}", file=sys.stderr)
@@ -135,9 +520,219 @@ def parse_content_provider(output, check=True):
         return None
 
 
+def stream_find_element(output, predicate, check=True):
+    """Find the first node matching predicate, decoding the tree lazily.
+
+    Top-level nodes of the result are decoded one at a time, so decoding
+    stops as soon as a subtree contains a match instead of materializing
+    the whole tree first.
+
+    Args:
+        output: Raw adb output of an a11y_tree query
+        predicate: Callable taking a node and returning True on match
+        check: If True, exit on error; if False, return None on error
+
+    Returns:
+        Matching node, or None if not found
+    """
+    result = content_provider_result(output, check=check)
+    if result is None:
+        return None
+
+    decoder = json.JSONDecoder()
+    try:
+        pos = _WHITESPACE_RE.match(result).end()
+        if not result.startswith("[", pos):
+            # Not a node list (e.g. single root), nothing to stream
+            tree = json_loads(result)
+            nodes = tree if isinstance(tree, list) else [tree]
+            return next(filter(predicate, iter_tree(nodes)), None)
+
+        pos += 1
+        while True:
+            pos = _WHITESPACE_RE.match(result, pos).end()
+            if result.startswith("]", pos):
+                return None
+            node, pos = decoder.raw_decode(result, pos)
+            found = next(filter(predicate, iter_tree([node])), None)
+            if found:
+                return found
+            pos = _WHITESPACE_RE.match(result, pos).end()
+            if result.startswith(",", pos):
+                pos += 1
+    except json.JSONDecodeError as e:
+        if check:
+            print(f"Error: JSON parse failed: {e}", file=sys.stderr)
+            sys.exit(1)
+        return None
+
+
+def content_query(uri):
+    """Build the shell command that queries a ContentProvider URI."""
+    return f"content query --uri {uri}"
+
+
+def tree_query(full=False):
+    """Build the shell command that queries the a11y tree.
+
+    Args:
+        full: If True, use a11y_tree_full with state properties
+    """
+    return content_query(A11Y_TREE_FULL_URI if full else A11Y_TREE_URI)
+
+
+def batch_query(commands, serial=None, timeout=10, check=True, binary=False):
+    """Run several shell commands in a single adb round-trip.
+
+    Commands are chained in one shell line with a separator echoed
+    between them, and the combined stdout is split back per command.
+
+    Args:
+        commands: List of shell command strings
+        serial: Device serial number
+        timeout: Command timeout in seconds
+        check: If True, exit on error; if False, return None on error
+        binary: If True, return each stdout as undecoded bytes
+
+    Returns:
+        List of stdout strings (one per command), or None if check=False
+        and the batch failed
+    """
+    script = f"; echo {BATCH_SEPARATOR}; ".join(commands)
+    output = run_adb(["shell", script], serial=serial, timeout=timeout, check=check, binary=binary)
+    if output is None:
+        return None
+    separator = BATCH_SEPARATOR + "\n"
+    chunks = output.split(separator.encode() if binary else separator)
+    # Pad in case a command swallowed its separator
+    chunks += [output[:0]] * (len(commands) - len(chunks))
+    return chunks
+
+
+def parse_tree(output, full=False):
+    """Parse an a11y tree query response.
+
+    Args:
+        output: Raw output of the tree_query() command
+        full: If True, the output came from a11y_tree_full
+
+    Returns:
+        Parsed tree (list), or None if parsing failed
+    """
+    tree_data = parse_content_provider(output, check=False)
+    if not tree_data:
+        return None
+    # a11y_tree_full returns a single root dict, wrap and assign indices
+    if full and isinstance(tree_data, dict):
+        tree = [tree_data]
+        # Pre-order numbering from 1, without recursion
+        for i, node in enumerate(iter_tree(tree), 1):
+            node["index"] = i
+        return tree
+    return tree_data
+
+
+def _cache_path(kind, serial, ext="json"):
+    """Get the path of a per-device cache file shared across invocations.
+
+    Files are keyed by -s or ANDROID_SERIAL. Without either, adb picks
+    the device, so a later invocation may well talk to a different one.
+
+    Returns:
+        Path, or None if the device isn't named and nothing should be
+        cached across invocations
+    """
+    device = serial or os.environ.get("ANDROID_SERIAL")
+    if not device:
+        return None
+    # Imported lazily: tempfile is a noticeable share of startup time and
+    # scripts that don't touch a cache never need it
+    import tempfile
+    return os.path.join(tempfile.gettempdir(), f"droidrun-{kind}-{device}.{ext}")
+
+
+def _tree_cache_path(serial, full):
+    return _cache_path("tree-full" if full else "tree", serial, "txt")
+
+
+def load_tree_cache(serial=None, full=False):
+    """Load a recent raw tree response saved by save_tree_cache().
+
+    Returns:
+        Raw a11y tree query output, or None if caching is disabled or the
+        cached response is missing, not ours or older than TREE_CACHE_TTL
+    """
+    if TREE_CACHE_TTL <= 0:
+        return None
+    path = _tree_cache_path(serial, full)
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+        # The file lives under a predictable name in a shared temp dir
+        if hasattr(os, "getuid") and st.st_uid != os.getuid():
+            return None
+        if time.time() - st.st_mtime > TREE_CACHE_TTL:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def save_tree_cache(output, serial=None, full=False):
+    """Save a successful raw tree response for reuse within TREE_CACHE_TTL.
+
+    Error responses are not saved, so a failed query is never replayed.
+    The file is private to the user as it holds on-screen text.
+    """
+    if TREE_CACHE_TTL <= 0 or content_provider_result(output, check=False) is None:
+        return
+    path = _tree_cache_path(serial, full)
+    if path is None:
+        return
+    tmp = f"{path}.{os.getpid()}"
+    try:
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(output)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def query_tree_output(serial=None, full=False, check=True, use_cache=False):
+    """Query the raw a11y tree response.
+
+    Args:
+        serial: Device serial number
+        full: If True, use a11y_tree_full with state properties
+        check: If True, exit on error; if False, return None on error
+        use_cache: If True, reuse a response cached within TREE_CACHE_TTL
+                   and cache a fresh one. Only for index lookups, which
+                   refer to the tree droid-observe just showed.
+
+    Returns:
+        Raw a11y tree query output (bytes), or None if check=False and the
+        query failed
+    """
+    if use_cache:
+        output = load_tree_cache(serial, full)
+        if output:
+            return output
+    outputs = batch_query([tree_query(full)], serial=serial, check=check, binary=True)
+    output = outputs[0] if outputs else None
+    if use_cache:
+        save_tree_cache(output, serial, full)
+    return output
+
+
 def query_tree_with_retry(serial=None, max_retries=MAX_RETRIES, delay=RETRY_DELAY, full=False):
     """Query a11y_tree with retry logic.
 
+    Always queries the device: the tree cache is never read here, so
+    polls and retries see the current screen.
+
     Args:
         serial: Device serial number
         max_retries: Maximum number of attempts
@@ -147,28 +742,10 @@ def query_tree_with_retry(serial=None, max_retries=MAX_RETRIES, delay=RETRY_DELA
     Returns:
         Parsed tree (list), or None if all retries failed
     """
-    uri = "content://com.droidrun.portal/a11y_tree_full" if full else "content://com.droidrun.portal/a11y_tree"
-
     for attempt in range(max_retries):
-        output = run_adb(
-            ["shell", "content", "query", "--uri", uri],
-            serial=serial,
-            check=False,
-        )
-        tree_data = parse_content_provider(output, check=False)
-        if tree_data:
-            # a11y_tree_full returns a single root dict, wrap and assign indices
-            if full and isinstance(tree_data, dict):
-                tree = [tree_data]
-                counter = [1]
-                def assign_indices(nodes):
-                    for node in nodes:
-                        node["index"] = counter[0]
-                        counter[0] += 1
-                        assign_indices(node.get("children", []))
-                assign_indices(tree)
-                return tree
-            return tree_data
+        tree = parse_tree(query_tree_output(serial, full=full, check=False), full=full)
+        if tree:
+            return tree
         if attempt < max_retries - 1:
             time.sleep(delay)
     return None
@@ -182,17 +759,21 @@ def parse_bounds(bounds):
     """Parse bounds into (l, t, r, b).
 
     Args:
-        bounds: Either a string 'left, top, right, bottom' or
-                a dict {'left': l, 'top': t, 'right': r, 'bottom': b}
+        bounds: A string 'left, top, right, bottom', a dict
+                {'left': l, 'top': t, 'right': r, 'bottom': b}, or an
+                already-parsed tuple (returned as is)
 
     Returns:
         Tuple (left, top, right, bottom)
     """
+    if isinstance(bounds, tuple):
+        return bounds
     if isinstance(bounds, dict):
         return bounds["left"], bounds["top"], bounds["right"], bounds["bottom"]
-    # String format: "left, top, right, bottom"
-    parts = [int(x.strip()) for x in bounds.split(",")]
-    return parts[0], parts[1], parts[2], parts[3]
+    # String format: "left, top, right, bottom" (int() tolerates the spaces).
+    # A plain split is ~1.6x faster here than a precompiled regex match.
+    l, t, r, b = map(int, bounds.split(","))
+    return l, t, r, b
 
 
 def get_bounds(node):
@@ -212,14 +793,31 @@ def get_bounds(node):
     return ""
 
 
-def center_of(bounds_str):
-    """Get center point of bounds."""
-    l, t, r, b = parse_bounds(bounds_str)
+def node_bounds(node):
+    """Get parsed bounds of a node, memoized on the node.
+
+    Filtering, tap point detection and formatting all need the same
+    bounds, so each node's bounds string is parsed at most once per run.
+
+    Returns:
+        Tuple (left, top, right, bottom), or None if the node has no bounds
+    """
+    try:
+        return node["_bounds"]
+    except KeyError:
+        bounds = get_bounds(node)
+        parsed = node["_bounds"] = parse_bounds(bounds) if bounds else None
+        return parsed
+
+
+def center_of(bounds):
+    """Get center point of bounds (any form parse_bounds() accepts)."""
+    l, t, r, b = parse_bounds(bounds)
     return (l + r) // 2, (t + b) // 2
 
 
 def get_element_size(bounds):
-    """Get width and height of bounds."""
+    """Get width and height of bounds (any form parse_bounds() accepts)."""
     l, t, r, b = parse_bounds(bounds)
     return r - l, b - t
 
@@ -230,11 +828,11 @@ def get_element_size(bounds):
 
 def is_too_small(node, min_size=MIN_ELEMENT_SIZE):
     """Check if element is smaller than minimum size."""
-    bounds = get_bounds(node)
+    bounds = node_bounds(node)
     if not bounds:
         return False
-    w, h = get_element_size(bounds)
-    return w < min_size or h < min_size
+    l, t, r, b = bounds
+    return r - l < min_size or b - t < min_size
 
 
 def is_keyboard_element(node):
@@ -255,11 +853,15 @@ def is_visible(node, screen_width, screen_height, threshold=VISIBILITY_THRESHOLD
     Returns:
         True if element is sufficiently visible
     """
-    bounds = get_bounds(node)
+    bounds = node_bounds(node)
     if not bounds:
         return True  # No bounds = assume visible
 
-    l, t, r, b = parse_bounds(bounds)
+    l, t, r, b = bounds
+
+    # Fast path: most elements lie entirely on screen, so no clipping needed
+    if l >= 0 and t >= 0 and r <= screen_width and b <= screen_height:
+        return r > l and b > t
 
     # Clip to screen
     vl = max(l, 0)
@@ -279,11 +881,22 @@ def is_visible(node, screen_width, screen_height, threshold=VISIBILITY_THRESHOLD
     return (visible_area / total_area) >= threshold
 
 
+# NOISE_CLASS_NAMES plus every other class name seen so far ("" = not noise),
+# so each distinct class name is resolved only once per run
+_noise_short_names = dict(NOISE_CLASS_NAMES)
+
+
 def is_noise(node):
     """Return True if this node is a layout container with no meaningful text."""
     class_name = node.get("className", "")
-    short_class = class_name.rsplit(".", 1)[-1] if "." in class_name else class_name
-    if short_class not in NOISE_CLASSES:
+    short_class = _noise_short_names.get(class_name)
+    if short_class is None:
+        # First time seeing this class: noise class from another package?
+        short_class = class_name[class_name.rfind(".") + 1:]
+        if short_class not in NOISE_CLASSES:
+            short_class = ""
+        _noise_short_names[class_name] = short_class
+    if not short_class:
         return False
     text = node.get("text", "")
     if not text or text == short_class or text == class_name:
@@ -322,24 +935,82 @@ def should_filter(node, screen_width=None, screen_height=None,
     return False
 
 
+def make_filter(screen_width=None, screen_height=None,
+                filter_noise=True, filter_small=True,
+                filter_keyboard=True, filter_invisible=True):
+    """Build a predicate equivalent to should_filter() with options bound once.
+
+    Only the enabled checks are kept, so walking a whole tree doesn't
+    re-evaluate the option flags and keyword arguments for every node.
+
+    Args:
+        Same as should_filter(), minus node
+
+    Returns:
+        Callable taking a node and returning True if it should be filtered out
+    """
+    checks = []
+    if filter_noise:
+        checks.append(is_noise)
+    if filter_small:
+        checks.append(is_too_small)
+    if filter_keyboard:
+        checks.append(is_keyboard_element)
+    if filter_invisible and screen_width and screen_height:
+        checks.append(lambda node: not is_visible(node, screen_width, screen_height))
+
+    def rejected(node):
+        for check in checks:
+            if check(node):
+                return True
+        return False
+    return rejected
+
+
 # =============================================================================
 # Tree Traversal
 # =============================================================================
 
-def walk_tree(nodes, results, **filter_kwargs):
-    """Recursively walk tree, collecting elements that pass filters.
+def iter_tree(nodes):
+    """Yield every node in depth-first pre-order without recursion.
+
+    Uses an explicit stack so deep trees don't hit the recursion limit
+    and callers can stop early on the first match.
+
+    Args:
+        nodes: List of tree nodes
+    """
+    stack = list(reversed(nodes))
+    while stack:
+        node = stack.pop()
+        yield node
+        children = node.get("children")
+        if children:
+            stack.extend(reversed(children))
+
+
+def walk_tree(nodes, results, index_map=None, **filter_kwargs):
+    """Walk tree, collecting elements that pass filters.
 
     Args:
         nodes: List of tree nodes
         results: List to append matching elements to
-        **filter_kwargs: Arguments passed to should_filter()
+        index_map: Optional dict to fill with index->element for every node
+                   (filtered or not) in the same pass, saving a separate
+                   build_index() walk
+        **filter_kwargs: Arguments passed to make_filter()
     """
-    for node in nodes:
-        if not should_filter(node, **filter_kwargs):
+    rejected = make_filter(**filter_kwargs)
+    if index_map is None:
+        results.extend(node for node in iter_tree(nodes) if not rejected(node))
+        return
+
+    for node in iter_tree(nodes):
+        idx = node.get("index")
+        if idx is not None:
+            index_map[idx] = node
+        if not rejected(node):
             results.append(node)
-        children = node.get("children", [])
-        if children:
-            walk_tree(children, results, **filter_kwargs)
 
 
 def build_index(tree):
@@ -352,58 +1023,123 @@ def build_index(tree):
         Dict mapping index (int) to element node
     """
     index_map = {}
+    for node in iter_tree(tree):
+        idx = node.get("index")
+        if idx is not None:
+            index_map[idx] = node
+    return index_map
 
-    def walk(nodes):
-        for node in nodes:
-            idx = node.get("index")
-            if idx is not None:
-                index_map[idx] = node
-            walk(node.get("children", []))
 
-    walk(tree)
-    return index_map
+# id(tree) -> (tree, index_map). Holding the tree keeps its id from being reused.
+_index_cache = {}
+
 
+def get_index(tree):
+    """Get the index->element dict for a tree, built once per tree object.
+
+    Call invalidate_index_cache() after mutating the tree.
+    """
+    entry = _index_cache.get(id(tree))
+    if entry is None:
+        entry = _index_cache[id(tree)] = (tree, build_index(tree))
+    return entry[1]
 
-def find_element(nodes, search_text, exact=False):
-    """Recursively search tree for first element matching text.
+
+def invalidate_index_cache(tree):
+    """Drop the cached index map of a tree."""
+    _index_cache.pop(id(tree), None)
+
+
+def resource_id_matcher(resource_id):
+    """Build a predicate matching nodes by full or short resource ID."""
+    def match(node):
+        rid = node.get("resourceId")
+        return bool(rid) and (rid == resource_id or short_resource_id(rid) == resource_id)
+    return match
+
+
+def text_matcher(search_text, exact=False, casefold=False):
+    """Build a predicate matching nodes by text.
 
     Args:
-        nodes: List of tree nodes
         search_text: Text to search for
+        exact: If True, require exact match; if False, case-insensitive substring match
+        casefold: If True, compare substrings with Unicode case folding
+                  (e.g. "STRASSE" matches "Straße") instead of lower()
+
+    Returns:
+        Callable taking a node and returning True on match
+    """
+    if exact:
+        def match_exact(node):
+            text = node.get("text", "")
+            return bool(text) and text == search_text
+        return match_exact
+
+    if casefold:
+        search_folded = search_text.casefold()
+        def match_casefold(node):
+            text = node.get("text", "")
+            return bool(text) and search_folded in text.casefold()
+        return match_casefold
+
+    # Lowercase the query once; only node text is lowered per node
+    search_lower = search_text.lower()
+    def match(node):
+        text = node.get("text", "")
+        return bool(text) and search_lower in text.lower()
+    return match
+
+
+def index_matcher(index):
+    """Build a predicate matching nodes by index."""
+    return lambda node: node.get("index") == index
+
+
+def find_element(nodes, search_text, exact=False, casefold=False, resource_id=None):
+    """Search tree for first element matching text.
+
+    Args:
+        nodes: List of tree nodes
+        search_text: Text to search for (may be empty if resource_id is given)
         exact: If True, require exact match; if False, substring match
+        casefold: If True, use Unicode case folding for substring match
+        resource_id: Only search the subtrees of elements with this resource
+                     ID (full or short form)
 
     Returns:
         Matching node, or None if not found
     """
-    for node in nodes:
-        text = node.get("text", "")
-        if text:
-            if exact:
-                if text == search_text:
-                    return node
-            else:
-                if search_text.lower() in text.lower():
-                    return node
-        children = node.get("children", [])
-        if children:
-            found = find_element(children, search_text, exact=exact)
+    if resource_id:
+        # Scanned lazily rather than indexed: a one-off lookup stops at the
+        # first hit, and nothing keeps the tree alive afterwards
+        scopes = filter(resource_id_matcher(resource_id), iter_tree(nodes))
+        if not search_text:
+            return next(scopes, None)
+        matcher = text_matcher(search_text, exact=exact, casefold=casefold)
+        for scope in scopes:
+            found = next(filter(matcher, iter_tree([scope])), None)
             if found:
                 return found
-    return None
+        return None
+    matcher = text_matcher(search_text, exact=exact, casefold=casefold)
+    return next(filter(matcher, iter_tree(nodes)), None)
 
 
 def find_element_by_index(tree, index):
-    """Find element by index using O(1) lookup.
+    """Find element by index.
+
+    The index is built on the first lookup and reused for later lookups
+    on the same tree.
 
     Args:
-        tree: List of tree nodes (will build index if needed)
+        tree: List of tree nodes
         index: Element index to find
 
     Returns:
         Matching node, or None if not found
     """
-    index_map = build_index(tree)
-    return index_map.get(index)
+    return get_index(tree).get(index)
 
 
 # =============================================================================
@@ -419,42 +1155,39 @@ def find_clear_point(bounds, blockers, depth=0, max_depth=4):
     Args:
         bounds: Tuple (l, t, r, b) of target element bounds
         blockers: List of (l, t, r, b) tuples for overlapping elements
-        depth: Current recursion depth
-        max_depth: Maximum recursion depth
+        depth: Subdivision depth of bounds
+        max_depth: Maximum subdivision depth
 
     Returns:
         (x, y) tuple of clear point, or None if no clear point found
     """
-    l, t, r, b = bounds
-    cx, cy = (l + r) // 2, (t + b) // 2
-
     def is_blocked(x, y):
         for bl, bt, br, bb in blockers:
             if bl <= x <= br and bt <= y <= bb:
                 return True
         return False
 
-    # Check center point
-    if not is_blocked(cx, cy):
-        return (cx, cy)
+    # Depth-first over quadrants, in the same order as a recursive search
+    stack = [(bounds, depth)]
+    while stack:
+        (l, t, r, b), d = stack.pop()
+        cx, cy = (l + r) // 2, (t + b) // 2
 
-    # Stop if too deep or area too small
-    area = (r - l) * (b - t)
-    if depth >= max_depth or area < 100:
-        return None
+        # Check center point
+        if not is_blocked(cx, cy):
+            return (cx, cy)
 
-    # Try quadrants
-    quadrants = [
-        (l, t, cx, cy),      # top-left
-        (cx, t, r, cy),      # top-right
-        (l, cy, cx, b),      # bottom-left
-        (cx, cy, r, b),      # bottom-right
-    ]
+        # Stop if too deep or area too small
+        area = (r - l) * (b - t)
+        if d >= max_depth or area < 100:
+            continue
 
-    for q in quadrants:
-        point = find_clear_point(q, blockers, depth + 1, max_depth)
-        if point:
-            return point
+        # Try quadrants: top-left, top-right, bottom-left, bottom-right
+        # (pushed in reverse so top-left is tried first)
+        stack.append(((cx, cy, r, b), d + 1))
+        stack.append(((l, cy, cx, b), d + 1))
+        stack.append(((cx, t, r, cy), d + 1))
+        stack.append(((l, t, cx, cy), d + 1))
 
     return None
 
@@ -469,11 +1202,11 @@ def get_tap_point(element, tree=None):
     Returns:
         (x, y) tuple of tap point
     """
-    bounds = get_bounds(element)
+    bounds = node_bounds(element)
     if not bounds:
         return None
 
-    l, t, r, b = parse_bounds(bounds)
+    l, t, r, b = bounds
     cx, cy = (l + r) // 2, (t + b) // 2
 
     # If no tree provided, just return center
@@ -484,27 +1217,26 @@ def get_tap_point(element, tree=None):
     target_idx = element.get("index")
     blockers = []
 
-    def find_overlaps(nodes):
-        for node in nodes:
-            idx = node.get("index")
-            if idx == target_idx:
-                continue
+    # Explicit stack rather than iter_tree(): the target's subtree and
+    # subtrees of nodes without bounds are pruned, not just skipped
+    stack = list(reversed(tree))
+    while stack:
+        node = stack.pop()
+        idx = node.get("index")
+        if idx == target_idx or not node.get("bounds"):
+            continue
 
-            node_bounds = node.get("bounds", "")
-            if not node_bounds:
-                continue
+        nl, nt, nr, nb = node_bounds(node)
 
-            nl, nt, nr, nb = parse_bounds(node_bounds)
+        # Check if this element overlaps and is "above" (higher index = rendered later)
+        if idx and target_idx and idx > target_idx:
+            # Check for overlap
+            if not (nr <= l or nl >= r or nb <= t or nt >= b):
+                blockers.append((nl, nt, nr, nb))
 
-            # Check if this element overlaps and is "above" (higher index = rendered later)
-            if idx and target_idx and idx > target_idx:
-                # Check for overlap
-                if not (nr <= l or nl >= r or nb <= t or nt >= b):
-                    blockers.append((nl, nt, nr, nb))
-
-            find_overlaps(node.get("children", []))
-
-    find_overlaps(tree)
+        children = node.get("children")
+        if children:
+            stack.extend(reversed(children))
 
     if not blockers:
         return (cx, cy)
@@ -518,18 +1250,25 @@ def get_tap_point(element, tree=None):
 # Formatting
 # =============================================================================
 
+@functools.lru_cache(maxsize=256)
 def short_class_name(class_name):
     """Get short class name without package prefix."""
+    # Cached: trees repeat the same handful of class names many times
     return class_name.rsplit(".", 1)[-1] if "." in class_name else class_name
 
 
+@functools.lru_cache(maxsize=4096)
 def short_resource_id(resource_id):
     """Get short resource ID without package prefix."""
+    # Cached like short_class_name(), including the "" result for obfuscated IDs
     if not resource_id or "obfuscated" in resource_id:
         return ""
     return resource_id.rsplit("/", 1)[-1] if "/" in resource_id else resource_id
 
 
+_BOOL_STR = {True: "true", False: "false"}
+
+
 def format_element(node, include_state=True):
     """Format element for display.
 
@@ -537,55 +1276,58 @@ def format_element(node, include_state=True):
         node: Element node dict
         include_state: If True, include checked/enabled/selected state
     """
-    idx = node.get("index", "?")
+    get = node.get
+    idx = get("index", "?")
     # Handle both text and contentDescription for a11y_tree_full
-    text = node.get("text", "") or node.get("contentDescription", "")
-    bounds = get_bounds(node)
-    class_name = short_class_name(node.get("className", ""))
-    resource_id = short_resource_id(node.get("resourceId", ""))
+    text = get("text", "") or get("contentDescription", "")
+    bounds = node_bounds(node)
+    class_name = short_class_name(get("className", ""))
+    resource_id = short_resource_id(get("resourceId", ""))
 
-    parts = [f"[{idx}]"]
-    if text:
-        parts.append(f'"{text}"')
+    # Optional pieces carry their own leading space, joined by one f-string
+    text_part = f' "{text}"' if text else ""
     if bounds:
-        cx, cy = center_of(bounds)
-        l, t, r, b = parse_bounds(bounds)
-        parts.append(f"center=({cx},{cy})")
-        parts.append(f"bounds=({l},{t},{r},{b})")
-    parts.append(f"class={class_name}")
-    if resource_id:
-        parts.append(f"id={resource_id}")
+        l, t, r, b = bounds
+        bounds_part = f" center=({(l + r) // 2},{(t + b) // 2}) bounds=({l},{t},{r},{b})"
+    else:
+        bounds_part = ""
+    id_part = f" id={resource_id}" if resource_id else ""
 
     # Add state properties for interactive elements
+    state_part = ""
     if include_state:
         states = []
-        # Check for checked state (switches, checkboxes, radio buttons)
-        # Handle both isChecked (full tree) and checked
-        is_checkable = node.get("isCheckable")
-        checked = node.get("isChecked")
+        # Checked state (switches, checkboxes, radio buttons)
+        checked = get("isChecked")
         if checked is None:
-            checked = node.get("checked")
-        if is_checkable or checked is not None:
-            if checked is not None:
-                states.append(f"checked={str(checked).lower()}")
-        # Check for enabled state
-        enabled = node.get("isEnabled")
+            checked = get("checked")
+        if checked is not None:
+            # Real bools (the usual case) skip the str()/lower() round-trip
+            value = _BOOL_STR[checked] if checked is True or checked is False else str(checked).lower()
+            states.append(f"checked={value}")
+        enabled = get("isEnabled")
         if enabled is None:
-            enabled = node.get("enabled")
+            enabled = get("enabled")
         if enabled is False:
             states.append("enabled=false")
-        # Check for selected state
-        selected = node.get("isSelected") or node.get("selected")
-        if selected:
+        if get("isSelected") or get("selected"):
             states.append("selected=true")
-        # Check for focused state
-        focused = node.get("isFocused") or node.get("focused")
-        if focused:
+        if get("isFocused") or get("focused"):
             states.append("focused=true")
         if states:
-            parts.append(f"[{', '.join(states)}]")
+            state_part = f" [{', '.join(states)}]"
+
+    return f"[{idx}]{text_part}{bounds_part} class={class_name}{id_part}{state_part}"
+
 
-    return " ".join(parts)
+def format_elements(nodes, include_state=True):
+    """Format a list of elements for display, one per line.
+
+    Returns a single string so callers can print a whole tree with one
+    write instead of one per element (each a syscall when unbuffered).
+    """
+    fmt = format_element
+    return "\n".join([fmt(node, include_state) for node in nodes])
 
 
 def format_element_json(node):
@@ -597,61 +1339,377 @@ def format_element_json(node):
     Returns:
         Dict with standardized element properties
     """
+    get = node.get
     bounds = get_bounds(node)
     center = None
     if bounds:
-        cx, cy = center_of(bounds)
-        center = [cx, cy]
+        l, t, r, b = node_bounds(node)
+        center = [(l + r) // 2, (t + b) // 2]
 
     # Handle both text and contentDescription
-    text = node.get("text", "") or node.get("contentDescription", "")
+    text = get("text", "") or get("contentDescription", "")
+
+    # Prefer the a11y_tree_full keys; checked/enabled only fall back when
+    # those are missing, since False is meaningful for them
+    checked = get("isChecked")
+    if checked is None:
+        checked = get("checked")
+    enabled = get("isEnabled")
+    if enabled is None:
+        enabled = get("enabled")
 
     return {
-        "index": node.get("index"),
+        "index": get("index"),
         "text": text,
-        "className": short_class_name(node.get("className", "")),
+        "className": short_class_name(get("className", "")),
         "bounds": bounds,
         "center": center,
-        "resourceId": short_resource_id(node.get("resourceId", "")),
-        "checked": node.get("isChecked") if node.get("isChecked") is not None else node.get("checked"),
-        "enabled": node.get("isEnabled") if node.get("isEnabled") is not None else node.get("enabled"),
-        "selected": node.get("isSelected") or node.get("selected"),
-        "focused": node.get("isFocused") or node.get("focused"),
-        "clickable": node.get("isClickable") or node.get("clickable"),
+        "resourceId": short_resource_id(get("resourceId", "")),
+        "checked": checked,
+        "enabled": enabled,
+        "selected": get("isSelected") or get("selected"),
+        "focused": get("isFocused") or get("focused"),
+        "clickable": get("isClickable") or get("clickable"),
     }
 
 
+# =============================================================================
+# Input
+# =============================================================================
+
+def parse_touch_device(getevent_output):
+    """Find the touchscreen in `getevent -lp` output.
+
+    Returns:
+        Dict {'path': ..., 'max_x': ..., 'max_y': ...}, or None if no
+        multi-touch device was found
+    """
+    device = None
+    for line in getevent_output.splitlines():
+        if line.startswith("add device"):
+            if device and "max_x" in device and "max_y" in device:
+                return device
+            device = {"path": line.rsplit(":", 1)[-1].strip()}
+            continue
+        match = _TOUCH_AXIS_RE.search(line)
+        if device is not None and match:
+            device["max_" + match.group(1).lower()] = int(match.group(2))
+    if device and "max_x" in device and "max_y" in device:
+        return device
+    return None
+
+
+def _touch_device_cache_path(serial):
+    return _cache_path("touch", serial)
+
+
+def _is_touch_device(device):
+    """Check that a touch device dict is safe to build sendevent lines from.
+
+    The path ends up unquoted in a device shell command, so only plain
+    /dev/input/eventN paths are accepted.
+    """
+    return (
+        isinstance(device, dict)
+        and isinstance(device.get("path"), str)
+        and _INPUT_DEVICE_RE.fullmatch(device["path"]) is not None
+        and all(type(device.get(key)) is int and device[key] >= 0 for key in ("max_x", "max_y"))
+        and all(type(device.get(key)) is int and device[key] > 0 for key in ("width", "height"))
+    )
+
+
+def get_touch_device(serial=None):
+    """Get the touchscreen device and axis ranges, cached across invocations.
+
+    The entry also holds the size tap coordinates are given in (see
+    parse_input_size()), queried in the same round-trip.
+
+    Returns:
+        Dict from parse_touch_device() plus 'width' and 'height', or None
+        if not found
+    """
+    path = _touch_device_cache_path(serial)
+    device = _load_json_cache(path, TOUCH_DEVICE_CACHE_TTL)
+    if device == {}:
+        return None  # Marks a device where sendevent is not permitted
+    if _is_touch_device(device):
+        return device
+    outputs = batch_query(["getevent -lp", SCREEN_SIZE_CMD], serial=serial, check=False)
+    if not outputs:
+        return None
+    device = parse_touch_device(outputs[0])
+    size = parse_input_size(outputs[1])
+    if not device or not size:
+        return None
+    device["width"], device["height"] = size
+    if not _is_touch_device(device):
+        return None
+    _save_json_cache(path, device)
+    return device
+
+
+def sendevent_touch(x, y, serial=None, duration_ms=0):
+    """Touch the screen by writing input events directly with sendevent.
+
+    Screen coordinates are scaled from the input size to the
+    touchscreen's axis range, which assumes the device is in its natural
+    orientation.
+
+    Args:
+        x, y: Screen coordinates
+        serial: Device serial number
+        duration_ms: How long to hold the touch (0 for a tap)
+
+    Returns:
+        True if the events were sent, False if sendevent is unavailable
+    """
+    device = get_touch_device(serial)
+    if not device:
+        return False
+    dx = x * (device["max_x"] + 1) // device["width"]
+    dy = y * (device["max_y"] + 1) // device["height"]
+
+    dev = device["path"]
+    down = [
+        (EV_ABS, ABS_MT_TRACKING_ID, 1),
+        (EV_ABS, ABS_MT_POSITION_X, dx),
+        (EV_ABS, ABS_MT_POSITION_Y, dy),
+        (EV_KEY, BTN_TOUCH, 1),
+        (EV_SYN, SYN_REPORT, 0),
+    ]
+    up = [
+        # sendevent parses values with atoi(), so -1 rather than 0xFFFFFFFF
+        (EV_ABS, ABS_MT_TRACKING_ID, -1),
+        (EV_KEY, BTN_TOUCH, 0),
+        (EV_SYN, SYN_REPORT, 0),
+    ]
+    commands = [f"sendevent {dev} {t} {c} {v}" for t, c, v in down]
+    if duration_ms:
+        commands.append(f"sleep {duration_ms / 1000}")
+    commands += [f"sendevent {dev} {t} {c} {v}" for t, c, v in up]
+    timeout = 10 + duration_ms / 1000
+    # Exit status 0 either way so sendevent's error message comes back
+    script = f"{{ {' && '.join(commands)}; }} 2>&1 || echo {SENDEVENT_FAILED}"
+    output = run_adb(["shell", script], serial=serial, timeout=timeout, check=False)
+    if output is None:
+        # adb itself failed (e.g. a timeout); try sendevent again next time
+        return False
+    if SENDEVENT_FAILED in output:
+        if "permission denied" in output.lower():
+            # No access to /dev/input; don't retry this device
+            _save_json_cache(_touch_device_cache_path(serial), {})
+        return False
+    return True
+
+
+def tap(x, y, serial=None, message=None):
+    """Tap screen coordinates, via sendevent when DROID_FAST_TAP=1.
+
+    Passing a message marks the tap as the caller's last action: the
+    message is printed and adb may replace the process (see run_adb_exec()).
+    """
+    if FAST_TAP and sendevent_touch(x, y, serial=serial):
+        if message:
+            print(message)
+        return
+    args = ["shell", "input", "tap", str(x), str(y)]
+    if message:
+        run_adb_exec(args, serial=serial, message=message)
+    else:
+        run_adb(args, serial=serial)
+
+
+def long_press(x, y, duration_ms, serial=None, message=None):
+    """Long-press screen coordinates, via sendevent when DROID_FAST_TAP=1.
+
+    The message argument behaves as in tap().
+    """
+    if FAST_TAP and sendevent_touch(x, y, serial=serial, duration_ms=duration_ms):
+        if message:
+            print(message)
+        return
+    # Long-press = swipe with same start/end coordinates
+    args = ["shell", "input", "swipe", str(x), str(y), str(x), str(y), str(duration_ms)]
+    if message:
+        run_adb_exec(args, serial=serial, message=message)
+    else:
+        run_adb(args, serial=serial, timeout=10 + duration_ms / 1000)
+
+
 # =============================================================================
 # Phone State
 # =============================================================================
 
 def get_phone_state(serial=None):
     """Query phone state (current app, keyboard, focused element)."""
-    output = run_adb(
-        ["shell", "content", "query", "--uri",
-         "content://com.droidrun.portal/phone_state"],
-        serial=serial,
-    )
-    return parse_content_provider(output)
+    outputs = batch_query([content_query(PHONE_STATE_URI)], serial=serial, binary=True)
+    return parse_content_provider(outputs[0])
+
+
+def parse_screen_size(output):
+    """Parse `wm size` output.
+
+    Returns:
+        (width, height) tuple, or None if no size was found
+    """
+    if not output:
+        return None
+    # Output format: "Physical size: 1080x1920"
+    pattern = _SIZE_BYTES_RE if isinstance(output, bytes) else _SIZE_RE
+    match = pattern.search(output)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    return None
+
+
+def parse_input_size(output):
+    """Parse the size `input` coordinates refer to from `wm size` output.
+
+    With a display size override ("Override size: 1080x2400"), a11y
+    bounds and `input tap` use the override rather than the physical
+    size, so it takes precedence.
+
+    Returns:
+        (width, height) tuple, or None if no size was found
+    """
+    match = _OVERRIDE_SIZE_RE.search(output) if output else None
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    return parse_screen_size(output)
+
+
+def _screen_size_cache_path(serial):
+    return _cache_path("screen", serial)
+
+
+def _load_json_cache(path, ttl):
+    """Load JSON saved by _save_json_cache() if younger than ttl seconds.
+
+    Like the tree cache, a file owned by another user is ignored. A path
+    of None (see _cache_path()) never has a cached value.
+    """
+    if path is None:
+        return None
+    try:
+        st = os.stat(path)
+        if hasattr(os, "getuid") and st.st_uid != os.getuid():
+            return None
+        if time.time() - st.st_mtime > ttl:
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_json_cache(path, data):
+    """Atomically write JSON for reuse by later invocations.
+
+    The temp file is created exclusively with mode 0600, so a file or
+    symlink planted under its name is never written through. Nothing is
+    written for a path of None.
+    """
+    if path is None:
+        return
+    tmp = f"{path}.{os.getpid()}"
+    try:
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+# Screen sizes already known to this process, keyed by serial
+_screen_sizes = {}
+
+
+def load_screen_size_cache(serial=None):
+    """Load a screen size saved within SCREEN_SIZE_CACHE_TTL.
+
+    Returns:
+        (width, height) tuple, or None if missing or stale
+    """
+    size = _screen_sizes.get(serial)
+    if size is not None:
+        return size
+    try:
+        w, h = _load_json_cache(_screen_size_cache_path(serial), SCREEN_SIZE_CACHE_TTL)
+        size = _screen_sizes[serial] = (int(w), int(h))
+        return size
+    except (ValueError, TypeError):
+        return None
+
+
+def save_screen_size_cache(size, serial=None):
+    """Save a queried screen size for this and later invocations."""
+    _screen_sizes[serial] = tuple(size)
+    _save_json_cache(_screen_size_cache_path(serial), list(size))
+
+
+def invalidate_screen_size_cache(serial=None):
+    """Drop the cached screen size (e.g. after rotation)."""
+    _screen_sizes.pop(serial, None)
+    path = _screen_size_cache_path(serial)
+    if path is None:
+        return
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def resolve_screen_size(output, serial=None):
+    """Turn `wm size` output into a screen size, caching it on success.
+
+    Returns:
+        (width, height) tuple, or DEFAULT_SCREEN_SIZE if parsing failed
+    """
+    size = parse_screen_size(output)
+    if size is None:
+        return DEFAULT_SCREEN_SIZE
+    save_screen_size_cache(size, serial)
+    return size
+
+
+def query_tree_and_screen(serial=None, full=False, extra_commands=()):
+    """Query the a11y tree and screen size in one adb round-trip.
+
+    A screen size cached within SCREEN_SIZE_CACHE_TTL is reused, and then
+    only the tree is queried. Extra shell commands ride along in the same
+    batch.
+
+    Args:
+        serial: Device serial number
+        full: If True, use a11y_tree_full with state properties
+        extra_commands: Further shell commands to batch with the queries
+
+    Returns:
+        Tuple (tree output bytes, (width, height), list of extra command
+        outputs as bytes). Outputs are b"" if the query failed.
+    """
+    screen_size = load_screen_size_cache(serial)
+    commands = [tree_query(full)]
+    if screen_size is None:
+        commands.append(SCREEN_SIZE_CMD)
+    commands.extend(extra_commands)
+    outputs = batch_query(commands, serial=serial, check=False, binary=True) or [b""] * len(commands)
+
+    if screen_size is None:
+        screen_size = resolve_screen_size(outputs[1], serial)
+        return outputs[0], screen_size, outputs[2:]
+    return outputs[0], screen_size, outputs[1:]
 
 
 def get_screen_size(serial=None):
-    """Get screen dimensions from device.
+    """Get screen dimensions from device, reusing a recently cached value.
 
     Returns:
         (width, height) tuple, or (1080, 1920) as default
     """
-    output = run_adb(
-        ["shell", "wm", "size"],
-        serial=serial,
-        check=False,
-    )
-    if output:
-        # Output format: "Physical size: 1080x1920"
-        for line in output.strip().split("\n"):
-            if "size:" in line.lower():
-                size_part = line.split(":")[-1].strip()
-                if "x" in size_part:
-                    w, h = size_part.split("x")
-                    return int(w), int(h)
-    return 1080, 1920  # Default fallback
+    size = load_screen_size_cache(serial)
+    if size:
+        return size
+    outputs = batch_query([SCREEN_SIZE_CMD], serial=serial, check=False)
+    return resolve_screen_size(outputs[0] if outputs else None, serial)